@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Response, Depends
 from utils.db import get_database
+from utils.versions import current_version, remember_version, next_version, bot_write_lock, bot_etag, etag_matches
+from utils.anomaly import record_sample, get_stats
+from utils.admission import admission, rate_limiter, Overloaded
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
@@ -10,18 +13,44 @@ class BotGet(BaseModel):
     mac: str
 
 @router.get("/bot/get")
-def get_bot(details: BotGet):
+def get_bot(details: BotGet, response: Response, if_none_match: Optional[str] = Header(None)):
+    # Answer unchanged bots from the cached version without a database round trip
+    version = current_version(details.mac)
+    if version is not None and etag_matches(if_none_match, bot_etag(version)):
+        return Response(status_code=304, headers={"ETag": bot_etag(version)})
+
     db = get_database()
     
-    response = db.table("bots").select("*").eq("mac", str(details.mac)).single().execute()
+    result = db.table("bots").select("*").eq("mac", str(details.mac)).execute()
     
-    if not response.data or len(response.data) == 0:
+    if not result.data or len(result.data) == 0:
         raise HTTPException(
             status_code=404,
             detail=f"Bot with MAC {details.mac} not found"
         )
     
-    return response.data[0]
+    # Tag with the row's own version, the cache may already be ahead of what was read
+    bot = result.data[0]
+    remember_version(details.mac, bot.get("version"))
+    etag = bot_etag(bot.get("version"))
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return bot
+
+@router.get("/bot/stats")
+def get_bot_stats(details: BotGet):
+    stats = get_stats(details.mac)
+
+    if stats is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No sensor statistics for bot with MAC {details.mac}"
+        )
+
+    return {"mac": details.mac, **stats}
 
 class BotUpdate(BaseModel):
     mac: str
@@ -56,64 +85,91 @@ class BotUpdate(BaseModel):
     route_topspeed: Optional[float] = None
     route_measured_speed: Optional[float] = None
 
-@router.post("/bot/update")
+async def admit_update(bot_data: BotUpdate):
+    '''Rate limit each bot to its heartbeat period and bound writes in flight, rejecting with 429'''
+    try:
+        rate_limiter.check(bot_data.mac, bot_data.heartbeat_period)
+        await admission.acquire()
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Ingest overloaded for bot with MAC {bot_data.mac}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    try:
+        yield
+    finally:
+        admission.release()
+
+@router.post("/bot/update", dependencies=[Depends(admit_update)])
 def update_bot(bot_data: BotUpdate):
-    db = get_database()
-    
-    # Check if bot exists (don't use .single() to avoid error on 0 rows)
-    existing_bot = db.table("bots").select("*").eq("mac", bot_data.mac).execute()
-    
-    # Prepare data for insert/update (exclude None values and mac for updates)
-    update_data = {}
-    insert_data = {"mac": bot_data.mac}  # Always include mac for inserts
-    
-    for field, value in bot_data.model_dump().items():
-        if value is not None:
-            insert_data[field] = value
-            if field != "mac":  # Don't include mac in update data
-                update_data[field] = value
-    
-    # Handle historical_positions if GPS coordinates are provided
-    if bot_data.gps_now_x is not None and bot_data.gps_now_y is not None:
-        new_position = [float(bot_data.gps_now_x), float(bot_data.gps_now_y)]
+    # One write at a time per bot so versions and historical_positions are not lost
+    with bot_write_lock(bot_data.mac):
+        db = get_database()
         
-        # Get existing historical_positions or initialize empty list
-        existing_positions = []
-        if existing_bot.data and len(existing_bot.data) > 0:
-            existing_positions = existing_bot.data[0].get("historical_positions", [])
+        # Check if bot exists (don't use .single() to avoid error on 0 rows)
+        existing_bot = db.table("bots").select("*").eq("mac", bot_data.mac).execute()
         
-        # Add new position and keep only last 50
-        existing_positions.append(new_position)
-        if len(existing_positions) > 50:
-            existing_positions = existing_positions[-50:]  # Keep last 50
+        # Prepare data for insert/update (exclude None values and mac for updates)
+        update_data = {}
+        insert_data = {"mac": bot_data.mac}  # Always include mac for inserts
         
-        # Add to both insert and update data
-        insert_data["historical_positions"] = existing_positions
-        update_data["historical_positions"] = existing_positions
-    
-    # If bot doesn't exist, create it
-    if not existing_bot.data or len(existing_bot.data) == 0:
-        response = db.table("bots").insert(insert_data).execute()
+        for field, value in bot_data.model_dump().items():
+            if value is not None:
+                insert_data[field] = value
+                if field != "mac":  # Don't include mac in update data
+                    update_data[field] = value
+        
+        # Handle historical_positions if GPS coordinates are provided
+        if bot_data.gps_now_x is not None and bot_data.gps_now_y is not None:
+            new_position = [float(bot_data.gps_now_x), float(bot_data.gps_now_y)]
+            
+            # Get existing historical_positions or initialize empty list
+            existing_positions = []
+            if existing_bot.data and len(existing_bot.data) > 0:
+                existing_positions = existing_bot.data[0].get("historical_positions", [])
+            
+            # Add new position and keep only last 50
+            existing_positions.append(new_position)
+            if len(existing_positions) > 50:
+                existing_positions = existing_positions[-50:]  # Keep last 50
+            
+            # Add to both insert and update data
+            insert_data["historical_positions"] = existing_positions
+            update_data["historical_positions"] = existing_positions
+        
+        # If bot doesn't exist, create it
+        if not existing_bot.data or len(existing_bot.data) == 0:
+            insert_data["version"] = next_version(None)
+            response = db.table("bots").insert(insert_data).execute()
+            
+            if not response.data or len(response.data) == 0:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to create bot with MAC {bot_data.mac}"
+                )
+            
+            remember_version(bot_data.mac, insert_data["version"])
+            record_sample(bot_data.mac, update_data)
+            return response.data[0]
+        
+        # Bot exists, update it
+        if not update_data:
+            # No fields to update, return existing bot
+            return existing_bot.data[0]
+        
+        update_data["version"] = next_version(existing_bot.data[0].get("version"))
+        response = db.table("bots").update(update_data).eq("mac", bot_data.mac).execute()
         
         if not response.data or len(response.data) == 0:
             raise HTTPException(
                 status_code=500,
-                detail=f"Failed to create bot with MAC {bot_data.mac}"
+                detail=f"Failed to update bot with MAC {bot_data.mac}"
             )
         
-        return response.data[0]
-    
-    # Bot exists, update it
-    if not update_data:
-        # No fields to update, return existing bot
-        return existing_bot.data[0]
-    
-    response = db.table("bots").update(update_data).eq("mac", bot_data.mac).execute()
-    
-    if not response.data or len(response.data) == 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to update bot with MAC {bot_data.mac}"
-        )
-    
-    return response.data[0]
\ No newline at end of file
+        remember_version(bot_data.mac, update_data["version"])
+
+        # Fold this report's sensor health readings into the rolling per-bot statistics
+        record_sample(bot_data.mac, update_data)
+        return response.data[0]
\ No newline at end of file
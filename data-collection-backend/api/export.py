@@ -0,0 +1,150 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from utils.db import get_database
+from api.bots import BotUpdate
+from typing import Optional, List, get_args
+from datetime import datetime, timezone
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+router = APIRouter()
+
+PAGE_SIZE = 500
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def column_types():
+    '''Export columns and their python types, taken from BotUpdate plus the stored-only columns'''
+    types = {"mac": str, "created_at": str, "version": int}
+
+    for name, field in BotUpdate.model_fields.items():
+        args = [arg for arg in get_args(field.annotation) if arg is not type(None)]
+        types[name] = args[0] if args else field.annotation
+
+    # Trail of the last positions kept by update_bot, exported as a JSON string
+    types["historical_positions"] = str
+    return types
+
+COLUMNS = column_types()
+
+def timestamp_bound(value: datetime) -> str:
+    '''
+    Format a range bound like the agent's epoch_to_utc, str() of a UTC datetime,
+    so it compares correctly against heartbeat_timestamp stored as text.
+    Naive bounds are taken to be UTC.
+    '''
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return str(value.astimezone(timezone.utc))
+
+def fetch_pages(macs: List[str], start: Optional[datetime], end: Optional[datetime]):
+    '''Yield pages of bot rows ordered by MAC, keyset paginated so only one page is held at a time'''
+    db = get_database()
+    last_mac = None
+
+    while True:
+        query = db.table("bots").select(", ".join(COLUMNS)).in_("mac", macs)
+
+        if start:
+            query = query.gte("heartbeat_timestamp", timestamp_bound(start))
+        if end:
+            query = query.lte("heartbeat_timestamp", timestamp_bound(end))
+        if last_mac:
+            query = query.gt("mac", last_mac)
+
+        rows = query.order("mac").limit(PAGE_SIZE).execute().data
+
+        if not rows:
+            return
+
+        for row in rows:
+            if row.get("historical_positions") is not None:
+                row["historical_positions"] = json.dumps(row["historical_positions"])
+
+        yield rows
+
+        if len(rows) < PAGE_SIZE:
+            return
+
+        last_mac = rows[-1]["mac"]
+
+def export_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(COLUMNS), extrasaction="ignore")
+    writer.writeheader()
+
+    for rows in pages:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def arrow_schema():
+    arrow_types = {float: pa.float64(), int: pa.int64(), str: pa.string()}
+    return pa.schema([(name, arrow_types[python_type]) for name, python_type in COLUMNS.items()])
+
+def export_arrow(pages, file_format: str):
+    '''Write each page as a record batch and flush the encoded bytes straight out'''
+    schema = arrow_schema()
+    buffer = io.BytesIO()
+
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(buffer, schema)
+    else:
+        writer = pa_ipc.new_stream(buffer, schema)
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    for rows in pages:
+        columns = {name: [row.get(name) for row in rows] for name in COLUMNS}
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        yield drain()
+
+    writer.close()
+    yield drain()
+
+@router.get("/bot/export")
+def export_bots(
+    macs: List[str] = Query(...),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = Query("csv", pattern="^(csv|arrow|parquet)$"),
+):
+    '''Stream bot telemetry for a set of MACs as CSV, Arrow IPC or Parquet'''
+    pages = fetch_pages(macs, start, end)
+
+    if format == "csv":
+        content = export_csv(pages)
+    else:
+        # pyarrow is pinned in requirements.txt, this only guards installs without it
+        if pa is None:
+            raise HTTPException(
+                status_code=501,
+                detail=f"Export format {format} needs pyarrow installed"
+            )
+        content = export_arrow(pages, format)
+
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="bots.{format}"'}
+    )
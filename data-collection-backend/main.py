@@ -1,7 +1,14 @@
+import os
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api import bots
+from api import bots, export
+from utils.sharding import run_sharded
+
+# WORKERS=1 runs a single reloading dev server,
+# WORKERS>1 runs one process per shard with bots split across them by MAC
+WORKERS = int(os.getenv("WORKERS", "1"))
+INTERNAL_BASE_PORT = int(os.getenv("INTERNAL_BASE_PORT", "9100"))
 
 app = FastAPI()
 
@@ -18,6 +25,10 @@ async def root():
     return {"message": "Active"}
 
 app.include_router(bots.router, tags=["bots"])
+app.include_router(export.router, tags=["export"])
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=9000, reload=True)
+    if WORKERS > 1:
+        run_sharded("main:app", WORKERS, host="0.0.0.0", port=9000, internal_base_port=INTERNAL_BASE_PORT)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=9000, reload=True)
@@ -0,0 +1,93 @@
+import asyncio
+import math
+import os
+import time
+from utils.sharding import normalize_mac
+
+MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "32"))
+MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "64"))
+QUEUE_TIMEOUT = float(os.getenv("INGEST_QUEUE_TIMEOUT", "0.5"))
+OVERLOAD_RETRY_AFTER = 1
+
+# Fastest heartbeat period the agent uses (alert level 3)
+MIN_HEARTBEAT_PERIOD = 0.25
+RATE_SLACK = float(os.getenv("INGEST_RATE_SLACK", "1.5"))  # allowed rate as a multiple of the expected one
+BUCKET_BURST = float(os.getenv("INGEST_BUCKET_BURST", "5"))
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class IngestAdmission:
+    '''
+    Bounds writes in flight and the number waiting behind them. Requests past the
+    queue depth, or that wait longer than the queue timeout, are rejected straight away.
+    Only touched from the worker's event loop, so needs no locking.
+    '''
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queued:
+            raise Overloaded(OVERLOAD_RETRY_AFTER)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(OVERLOAD_RETRY_AFTER)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self.semaphore.release()
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self):
+        self.tokens = BUCKET_BURST
+        self.updated = time.monotonic()
+
+    def take(self, rate: float) -> float:
+        '''Take one token, returns 0 if allowed or the seconds until a token is available'''
+        now = time.monotonic()
+        self.tokens = min(BUCKET_BURST, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / rate
+
+class BotRateLimiter:
+    '''Per-MAC token buckets refilled at the rate implied by each bot's heartbeat period'''
+
+    def __init__(self):
+        self.buckets = {}
+        self.periods = {}
+
+    def check(self, mac: str, heartbeat_period=None):
+        key = normalize_mac(mac)
+
+        # The agent truncates sub-second periods to 0, which floors to the fastest alert level
+        if heartbeat_period is not None:
+            self.periods[key] = max(MIN_HEARTBEAT_PERIOD, float(heartbeat_period))
+        period = self.periods.get(key, MIN_HEARTBEAT_PERIOD)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket()
+
+        wait = bucket.take(RATE_SLACK / period)
+        if wait:
+            raise Overloaded(max(1, math.ceil(wait)))
+
+admission = IngestAdmission(MAX_IN_FLIGHT, MAX_QUEUED, QUEUE_TIMEOUT)
+rate_limiter = BotRateLimiter()
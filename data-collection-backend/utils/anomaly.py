@@ -0,0 +1,146 @@
+import logging
+import math
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from utils.sharding import normalize_mac
+
+logger = logging.getLogger(__name__)
+
+# Continuous sensor health readings tracked with running mean/variance and an EWMA
+METRIC_FIELDS = ["gps_avg_read_time", "gps_max_read_time", "gps_hacc", "gps_pdop", "heartbeat_delta"]
+
+# 0/1 flags tracked as a rate over the last FLAG_WINDOW reports
+FLAG_FIELDS = ["compass_slow_read_flag", "compass_drdy_error_flag"]
+
+ZSCORE_THRESHOLD = float(os.getenv("ANOMALY_ZSCORE_THRESHOLD", "4.0"))
+FLAG_RATE_THRESHOLD = float(os.getenv("ANOMALY_FLAG_RATE_THRESHOLD", "0.2"))
+MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.1"))
+FLAG_WINDOW = int(os.getenv("ANOMALY_FLAG_WINDOW", "120"))
+MAX_EVENTS = 50
+
+class RunningStat:
+    '''Welford mean/variance plus an EWMA, O(1) per sample'''
+    __slots__ = ("count", "mean", "m2", "ewma")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+
+    def update(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.ewma = value if self.ewma is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * self.ewma
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def zscore(self, value: float):
+        '''z-score against the samples seen so far, None until there is enough history'''
+        std = self.std
+        if self.count < MIN_SAMPLES or std == 0.0:
+            return None
+        return (value - self.mean) / std
+
+    def summary(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "std": self.std, "ewma": self.ewma}
+
+class FlagRate:
+    '''Fraction of set flags over a sliding window, kept as a running sum'''
+    __slots__ = ("window", "total", "alerting")
+
+    def __init__(self):
+        self.window = deque(maxlen=FLAG_WINDOW)
+        self.total = 0
+        self.alerting = False
+
+    def update(self, flag: int):
+        flag = 1 if flag else 0
+        if len(self.window) == self.window.maxlen:
+            self.total -= self.window[0]
+        self.window.append(flag)
+        self.total += flag
+
+    @property
+    def rate(self) -> float:
+        return self.total / len(self.window) if self.window else 0.0
+
+    def summary(self) -> dict:
+        return {"samples": len(self.window), "rate": self.rate}
+
+class BotStats:
+    def __init__(self):
+        self.metrics = {field: RunningStat() for field in METRIC_FIELDS}
+        self.flags = {field: FlagRate() for field in FLAG_FIELDS}
+        self.events = deque(maxlen=MAX_EVENTS)
+
+    def observe(self, sample: dict) -> list:
+        '''Fold one ingest sample into the stats and return any anomaly events it raised'''
+        events = []
+        timestamp = datetime.now(timezone.utc).isoformat()
+
+        for field, stat in self.metrics.items():
+            value = sample.get(field)
+            if value is None:
+                continue
+
+            # Score against the history before this sample so an outlier cannot mask itself
+            zscore = stat.zscore(float(value))
+            if zscore is not None and abs(zscore) > ZSCORE_THRESHOLD:
+                events.append({"timestamp": timestamp, "field": field, "value": value, "zscore": zscore, "mean": stat.mean})
+
+            stat.update(float(value))
+
+        for field, flag in self.flags.items():
+            value = sample.get(field)
+            if value is None:
+                continue
+
+            flag.update(value)
+
+            # Raise once when the rate crosses the threshold, not on every sample above it
+            above = len(flag.window) >= MIN_SAMPLES and flag.rate > FLAG_RATE_THRESHOLD
+            if above and not flag.alerting:
+                events.append({"timestamp": timestamp, "field": field, "rate": flag.rate})
+            flag.alerting = above
+
+        self.events.extend(events)
+        return events
+
+    def summary(self) -> dict:
+        return {
+            "metrics": {field: stat.summary() for field, stat in self.metrics.items()},
+            "flags": {field: flag.summary() for field, flag in self.flags.items()},
+            "events": list(self.events),
+        }
+
+# Per-bot stats live on the worker that owns the MAC, see utils.sharding
+_stats = {}
+_lock = threading.Lock()
+
+def record_sample(mac: str, sample: dict) -> list:
+    key = normalize_mac(mac)
+
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = BotStats()
+        events = stats.observe(sample)
+
+    for event in events:
+        logger.warning(f"Sensor anomaly on bot {mac}: {event}")
+
+    return events
+
+def get_stats(mac: str):
+    '''Return a snapshot of a bot's stats, None if this worker has no samples for it'''
+    with _lock:
+        stats = _stats.get(normalize_mac(mac))
+        return stats.summary() if stats else None
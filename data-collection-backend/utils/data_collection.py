@@ -7,6 +7,8 @@ import os
 import logging
 from getmac import get_mac_address 
 import datetime
+import math
+import random
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +31,37 @@ heartbeat_file = f"/home/{robot_id}/robot/realtime/{robot_id}_heartbeat_broadcas
 ALERT_LEVEL_FILE = f"/home/{robot_id}/robot/swarm/alert_level.txt"
 ROBOT_HEARTBEAT_FILE = f"/home/{robot_id}/robot/realtime/{robot_id}_heartbeat_broadcast.txt"
 
+# Reporting configuration, only fields that moved past their deadband are sent
+ANGLE_DEADBAND_DEG = float(os.getenv("ANGLE_DEADBAND_DEG", "2.0"))
+POSITION_DEADBAND_M = float(os.getenv("POSITION_DEADBAND_M", "0.5"))  # gps_now_x/y are treated as planar metres
+KEYFRAME_INTERVAL = float(os.getenv("KEYFRAME_INTERVAL", "30.0"))  # seconds between full payloads
+MAX_SEND_INTERVAL = float(os.getenv("MAX_SEND_INTERVAL", "5.0"))  # ceiling while parked at alert level 0
+IDLE_BACKOFF = 1.5
+
+# Backoff when the server rejects an update with 429
+MAX_RETRY_BACKOFF = float(os.getenv("MAX_RETRY_BACKOFF", "30.0"))
+RETRY_JITTER = 0.5  # up to this fraction of the delay is added at random so bots spread out
+
+# Sent whenever their value changes at all
+DISCRETE_FIELDS = [
+    "gps_hacc_status",
+    "gps_satellites_used",
+]
+
+# Sent with every report so the server can track liveness, and so its sensor health
+# statistics see one sample per report rather than only the values that changed
+HEARTBEAT_FIELDS = [
+    "heartbeat_timestamp",
+    "heartbeat_period",
+    "heartbeat_delta",
+    "gps_avg_read_time",
+    "gps_max_read_time",
+    "gps_hacc",
+    "gps_pdop",
+    "compass_drdy_error_flag",
+    "compass_slow_read_flag",
+]
+
 def epoch_to_utc(timestamp):
     return str(datetime.datetime.fromtimestamp(timestamp, datetime.UTC))
 
@@ -152,8 +185,25 @@ async def read_sensor_data():
             await asyncio.sleep(1)
             continue
 
+class ServerBusy(Exception):
+    """Raised when the server sheds an update and asks us to come back later"""
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 1.0
+
+def retry_delay(retry_after, attempt):
+    """Honor Retry-After, doubling on consecutive rejections, with jitter on top"""
+    delay = min(MAX_RETRY_BACKOFF, max(retry_after, retry_after * (2 ** attempt)))
+    return delay + random.uniform(0, delay * RETRY_JITTER)
+
 async def write_sensor_data(data):
-    """Send sensor data to the FastAPI server every 1 second"""
+    """Send sensor data to the FastAPI server"""
     try:
         # Add the robot MAC address to the payload
         payload = {
@@ -170,10 +220,14 @@ async def write_sensor_data(data):
         if response.status_code == 200:
             logger.info(f"Successfully updated bot data for {robot_id}")
             return True
+        elif response.status_code == 429:
+            raise ServerBusy(parse_retry_after(response.headers.get("Retry-After")))
         else:
             logger.error(f"Failed to update bot data. Status: {response.status_code}, Response: {response.text}")
             return False
             
+    except ServerBusy:
+        raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error sending data to server: {e}")
         return False
@@ -181,21 +235,104 @@ async def write_sensor_data(data):
         logger.error(f"Unexpected error in write_sensor_data: {e}")
         return False
 
+def angle_difference(a, b):
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+def position_moved(payload, last_sent):
+    if "gps_now_x" not in payload or "gps_now_y" not in payload:
+        return False
+    if "gps_now_x" not in last_sent or "gps_now_y" not in last_sent:
+        return True
+
+    distance = math.hypot(payload["gps_now_x"] - last_sent["gps_now_x"], payload["gps_now_y"] - last_sent["gps_now_y"])
+    return distance > POSITION_DEADBAND_M
+
+def angle_moved(payload, last_sent):
+    if "compass_angle" not in payload:
+        return False
+    if "compass_angle" not in last_sent:
+        return True
+
+    return angle_difference(payload["compass_angle"], last_sent["compass_angle"]) > ANGLE_DEADBAND_DEG
+
+def build_delta(payload, last_sent):
+    """Return the subset of the payload that changed enough to be worth sending"""
+    delta = {field: payload[field] for field in HEARTBEAT_FIELDS if field in payload}
+
+    if angle_moved(payload, last_sent):
+        delta["compass_angle"] = payload["compass_angle"]
+        if "compass_timestamp" in payload:
+            delta["compass_timestamp"] = payload["compass_timestamp"]
+
+    if position_moved(payload, last_sent):
+        delta["gps_now_x"] = payload["gps_now_x"]
+        delta["gps_now_y"] = payload["gps_now_y"]
+        if "gps_timestamp" in payload:
+            delta["gps_timestamp"] = payload["gps_timestamp"]
+
+    for field in DISCRETE_FIELDS:
+        if field in payload and payload[field] != last_sent.get(field):
+            delta[field] = payload[field]
+
+    return delta
+
+def next_send_interval(current_interval, moving, alert_level):
+    """Snap to the alert-level period while moving, back off toward the ceiling while idle"""
+    floor = get_heartbeat_period(alert_level)
+
+    # Any raised alert level pins the rate to its heartbeat period
+    ceiling = MAX_SEND_INTERVAL if floor >= 1.0 else floor
+
+    if moving:
+        return floor
+
+    return min(ceiling, max(floor, current_interval * IDLE_BACKOFF))
+
 async def sensor_data_loop():
-    """Main loop to read and send sensor data every 1 second"""
+    """Main loop to read sensor data and send what changed, with a periodic full keyframe"""
+    last_sent = {}
+    last_keyframe = 0.0
+    send_interval = 1.0
+    rejections = 0
+
     while True:
+        moving = False
+
         try:
             sensor_data = await read_sensor_data()
             
             if sensor_data:
-                await write_sensor_data(sensor_data)
+                moving = angle_moved(sensor_data, last_sent) or position_moved(sensor_data, last_sent)
+                keyframe = time.time() - last_keyframe >= KEYFRAME_INTERVAL
+
+                data = sensor_data if keyframe else build_delta(sensor_data, last_sent)
+
+                # Only remember what the server actually accepted, a failed send forces a keyframe
+                if await write_sensor_data(data):
+                    rejections = 0
+                    if keyframe:
+                        last_sent = dict(sensor_data)
+                        last_keyframe = time.time()
+                    else:
+                        last_sent.update(data)
+                else:
+                    last_keyframe = 0.0
             else:
                 logger.warning("No sensor data available to send")
+
+        except ServerBusy as e:
+            # Rejected deltas stay unsent in last_sent, so the next report picks them up
+            delay = retry_delay(e.retry_after, rejections)
+            rejections += 1
+            logger.warning(f"{e}, backing off for {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
                 
         except Exception as e:
             logger.error(f"Error in sensor data loop: {e}")
-            
-        await asyncio.sleep(1.0)
+
+        send_interval = next_send_interval(send_interval, moving, read_alert_level())
+        await asyncio.sleep(send_interval)
 
 async def main():
     while True:
@@ -0,0 +1,221 @@
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import socket
+
+import httpx
+import uvicorn
+from uvicorn.importer import import_from_string
+
+logger = logging.getLogger(__name__)
+
+# Set on requests handed from one worker to another so they are never re-routed
+SHARD_FORWARD_HEADER = "x-shard-forwarded"
+
+# Response headers that describe the hop between workers, not the payload
+HOP_HEADERS = {"connection", "content-length", "content-encoding", "keep-alive", "transfer-encoding"}
+
+def normalize_mac(mac: str) -> str:
+    '''Canonical form of a MAC address used for hashing and per-bot state keys'''
+    return str(mac).strip().lower()
+
+class HashRing:
+    '''Consistent hash ring mapping bot MAC addresses to worker indexes'''
+
+    def __init__(self, workers: int, replicas: int = 256):
+        self.workers = workers
+        self.keys = []
+        self.owners = []
+
+        points = sorted(
+            (self._hash(f"worker-{index}-{replica}"), index)
+            for index in range(workers)
+            for replica in range(replicas)
+        )
+
+        for key, index in points:
+            self.keys.append(key)
+            self.owners.append(index)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def owner(self, mac: str) -> int:
+        '''Return the index of the worker responsible for this MAC'''
+        if self.workers <= 1:
+            return 0
+
+        position = bisect.bisect(self.keys, self._hash(normalize_mac(mac)))
+        return self.owners[position % len(self.owners)]
+
+class ShardRouterMiddleware:
+    '''
+    ASGI middleware that hands requests for bots owned by another worker over
+    to that worker's internal port, so each bot's updates always land on the
+    same process. Requests without a MAC in their JSON body are served locally.
+    '''
+
+    def __init__(self, app, index: int, ring: HashRing, internal_host: str = "127.0.0.1", internal_base_port: int = 9100):
+        self.app = app
+        self.index = index
+        self.ring = ring
+        self.internal_host = internal_host
+        self.internal_base_port = internal_base_port
+        self.client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._is_forwarded(scope):
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        owner = self._owner_for(body)
+
+        if owner is not None and owner != self.index:
+            if await self._forward(scope, body, owner, send):
+                return
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    def _is_forwarded(self, scope) -> bool:
+        '''Only trust the hand-off header on this worker's internal port, never from public clients'''
+        server = scope.get("server")
+        if not server or server[1] != self.internal_base_port + self.index:
+            return False
+
+        return any(name == SHARD_FORWARD_HEADER.encode("latin-1") for name, _ in scope["headers"])
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        return b"".join(chunks)
+
+    def _owner_for(self, body: bytes):
+        if not body:
+            return None
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+
+        if not isinstance(payload, dict) or not payload.get("mac"):
+            return None
+
+        return self.ring.owner(payload["mac"])
+
+    async def _forward(self, scope, body: bytes, owner: int, send) -> bool:
+        '''Proxy the request to the owning worker, returns False if it could not be reached'''
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=5)
+
+        url = f"http://{self.internal_host}:{self.internal_base_port + owner}{scope['path']}"
+        if scope["query_string"]:
+            url = f"{url}?{scope['query_string'].decode('latin-1')}"
+
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in scope["headers"]
+            if name.lower() not in (b"host", b"content-length")
+        ]
+        headers.append((SHARD_FORWARD_HEADER, str(self.index)))
+
+        try:
+            response = await self.client.request(scope["method"], url, content=body, headers=headers)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # Owner is down or restarting and never saw the request, serve locally rather than drop the sample
+            logger.warning(f"Worker {self.index} could not hand off to worker {owner}: {e}")
+            return False
+        except httpx.HTTPError as e:
+            # Owner may already have applied the write, running it again here would duplicate it
+            logger.error(f"Worker {self.index} lost hand-off to worker {owner}: {e}")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Owning worker did not respond"}'})
+            return True
+
+        response_headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.multi_items()
+            if name.lower() not in HOP_HEADERS
+        ]
+        response_headers.append((b"content-length", str(len(response.content)).encode("latin-1")))
+
+        await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+        await send({"type": "http.response.body", "body": response.content})
+        return True
+
+def bind_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+def serve_worker(app_path: str, index: int, workers: int, host: str, port: int, internal_base_port: int):
+    '''Entry point for one shard worker, owns every bot that hashes to its index'''
+    app = import_from_string(app_path)
+    app.add_middleware(
+        ShardRouterMiddleware,
+        index=index,
+        ring=HashRing(workers),
+        internal_base_port=internal_base_port,
+    )
+
+    # Public socket is shared by every worker through SO_REUSEPORT,
+    # the internal one only receives hand-offs from the other workers
+    public = bind_socket(host, port, reuse_port=True)
+    internal = bind_socket("127.0.0.1", internal_base_port + index)
+
+    server = uvicorn.Server(uvicorn.Config(app))
+    server.run(sockets=[public, internal])
+
+def run_sharded(app_path: str, workers: int, host: str, port: int, internal_base_port: int = 9100):
+    '''Start one shared-nothing process per worker and wait on them'''
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=serve_worker,
+            args=(app_path, index, workers, host, port, internal_base_port),
+            name=f"shard-{index}",
+        )
+        for index in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
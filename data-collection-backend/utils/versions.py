@@ -0,0 +1,60 @@
+import os
+import threading
+from utils.sharding import normalize_mac
+
+# Per-bot state version. Every writer of a bots row bumps its version column
+# (update_bot here, assign_bots in the webservice); this cache only remembers
+# the latest version this worker has written or read.
+#
+# The cache lets /bot/get answer 304 without a database call, which is only
+# exact while the owning worker is the sole writer of the row. A write from
+# elsewhere (a bot assignment, or a non-owner serving a request while the owner
+# is down) is not seen until this worker next writes or reads the row.
+# Set VERSION_CACHE=0 to always check against the database instead.
+VERSION_CACHE = os.getenv("VERSION_CACHE", "1") != "0"
+
+_versions = {}
+_write_locks = {}
+_lock = threading.Lock()
+
+def current_version(mac: str):
+    '''Return the cached version for a bot, None if unknown or the cache is disabled'''
+    if not VERSION_CACHE:
+        return None
+    return _versions.get(normalize_mac(mac))
+
+def remember_version(mac: str, version) -> None:
+    '''Record a version that is committed in the database, never moving it backwards'''
+    key = normalize_mac(mac)
+    version = int(version or 0)
+
+    with _lock:
+        if version > _versions.get(key, -1):
+            _versions[key] = version
+
+def next_version(stored_version) -> int:
+    return int(stored_version or 0) + 1
+
+def bot_write_lock(mac: str) -> threading.Lock:
+    '''Serialize read-modify-write cycles on one bot within this worker'''
+    key = normalize_mac(mac)
+
+    with _lock:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = _write_locks[key] = threading.Lock()
+        return lock
+
+def bot_etag(version) -> str:
+    return f'"{int(version or 0)}"'
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    '''Check an If-None-Match header against an ETag, using weak comparison'''
+    if not if_none_match:
+        return False
+
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
@@ -1,26 +1,58 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from utils.db import get_database
+from utils.etag import bot_etag, fleet_etag, etag_matches
+from postgrest.exceptions import APIError
+import json
 
 router = APIRouter(prefix="/api/bot")
 
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 100
+
+# Columns a client may request through fields=. Hand copied from BotUpdate in
+# data-collection-backend/api/bots.py (plus the stored-only columns), keep the two in sync.
+BOT_FIELDS = {
+    "mac", "created_at", "version", "user_assignment", "historical_positions",
+    "compass_angle", "compass_timestamp", "compass_drdy_error_flag", "compass_slow_read_flag",
+    "gps_now_x", "gps_now_y", "gps_timestamp", "gps_avg_read_time", "gps_max_read_time",
+    "gps_hacc", "gps_hacc_status", "gps_count", "gps_satellites_used", "gps_pdop",
+    "heartbeat_timestamp", "heartbeat_period", "heartbeat_delta",
+    "status_string", "status_color", "watchdog_string", "watchdog_color",
+    "route_timestamp", "route_now_x", "route_now_y", "route_hacc", "route_tgt_x", "route_tgt_y",
+    "route_tgt_heading", "route_topspeed", "route_measured_speed",
+}
+
 class BotData(BaseModel):
     bot_id: str
     user_id: str
 
+class BulkBotData(BaseModel):
+    bot_ids: List[str]
+    user_id: str
+
 @router.get("/find/{robot_id}")
-async def get_robot(robot_id: str):
+async def get_robot(robot_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     db = get_database()
 
     try: 
-        bot_result = db.table("bots").select("mac").eq("mac", robot_id).execute()
+        bot_result = db.table("bots").select("mac, version").eq("mac", robot_id).execute()
 
         if not bot_result:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"No Bot with the following ID: {str(robot_id)}"
             )
+
+        if bot_result.data:
+            etag = bot_etag(bot_result.data[0].get("version"))
+
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+            response.headers["ETag"] = etag
        
         return {
             "data": bot_result
@@ -32,38 +64,104 @@ async def get_robot(robot_id: str):
             detail=f"Failure to find bot: {robot_id}"
         )
 
+def select_columns(fields: Optional[str]) -> str:
+    '''Turn a comma separated fields parameter into a select string, mac is always included'''
+    if not fields:
+        return "*"
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in BOT_FIELDS]
+
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown bot fields: {', '.join(unknown)}"
+        )
+
+    return ", ".join(["mac"] + [field for field in requested if field != "mac"])
+
+def fetch_bot_batches(db, robots: List[str], columns: str):
+    '''Yield bot rows in MAC order, a batch at a time, keeping each IN filter short'''
+    for index in range(0, len(robots), STREAM_BATCH_SIZE):
+        batch = robots[index:index + STREAM_BATCH_SIZE]
+        yield db.table("bots").select(columns).in_("mac", batch).order("mac").execute().data
+
+def stream_bots(db, robots: List[str], columns: str):
+    '''Yield bot rows as NDJSON lines as each batch is fetched'''
+    for rows in fetch_bot_batches(db, robots, columns):
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+
+def user_bots_etag(db, robots: List[str], variant: str) -> str:
+    versions = [row for rows in fetch_bot_batches(db, robots, "mac, version") for row in rows]
+    return fleet_etag(versions, variant=variant)
+
 @router.get("/user-bots/{user_id}")
-async def get_user_bots(user_id: str):
+async def get_user_bots(
+    user_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    if_none_match: Optional[str] = Header(None),
+):
+    '''
+    List a user's bots ordered by MAC. Passing limit returns one page and the
+    cursor for the next, fields limits the columns returned and format=ndjson
+    streams one row per line as it is fetched.
+    '''
     db = get_database()
 
     try:
-        user_result = db.table("users").select("*").eq("id", user_id).execute()
+        columns = select_columns(fields)
+        user_result = db.table("users").select("robots").eq("id", user_id).execute()
 
-        if not user_result:
+        if not user_result.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"No User with the following ID: {str(user_id)}"
             )
         
-        robots = user_result.data[0]["robots"]
+        robots = sorted(user_result.data[0]["robots"] or [])
+
+        if cursor:
+            robots = [robot_id for robot_id in robots if robot_id > cursor]
+
+        next_cursor = None
+        if limit is not None and len(robots) > limit:
+            robots = robots[:limit]
+            next_cursor = robots[-1]
 
         if not robots:
-            return []
-        
-        data = []
+            if format == "ndjson":
+                return StreamingResponse(iter(()), media_type="application/x-ndjson")
+            return [] if limit is None else {"data": [], "next_cursor": None}
 
-        for robot_id in robots:
-            bot_result = db.table("bots").select("*").eq("mac", robot_id).execute()
-        
-            if not bot_result.data[0]:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"No Bot with the following ID: {str(robot_id)}"
-                )
-            
-            data.append(bot_result.data[0])
+        # Compare versions before pulling and serializing any full rows,
+        # a narrow mac/version scan that every format pays so clients always get a tag
+        etag = user_bots_etag(db, robots, f"{columns}|{format}|{next_cursor}")
+
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        if format == "ndjson":
+            headers = {"ETag": etag}
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+
+            return StreamingResponse(stream_bots(db, robots, columns), media_type="application/x-ndjson", headers=headers)
+
+        response.headers["ETag"] = etag
         
-        return data
+        data = [row for rows in fetch_bot_batches(db, robots, columns) for row in rows]
+
+        if limit is None:
+            return data
+
+        return {"data": data, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -71,54 +169,70 @@ async def get_user_bots(user_id: str):
         )
 
 
+def assign_bots(db, username: str, macs: List[str]):
+    '''Claim bots for a user through the assign_bots RPC, returns one result per MAC'''
+    try:
+        result = db.rpc("assign_bots", {"p_username": username, "p_macs": macs}).execute()
+    except APIError as e:
+        if e.code == "P0002":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No User with the following ID: {str(username)}"
+            )
+        raise
+
+    return [{"bot_id": row["bot_mac"], "status": row["result"]} for row in result.data]
+
 @router.post("/add")
 async def add_bot_to_account(bot_data: BotData):
     db = get_database()
 
     try: 
-        bot_result = db.table("bots").select("*").eq("mac", bot_data.bot_id).execute()
-        
-        if not bot_result.data[0]:
+        result = assign_bots(db, bot_data.user_id, [bot_data.bot_id])[0]
+
+        if result["status"] == "not_found":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"No Bot with the following ID: {str(bot_data.bot_id)}"
             )
-        
-        bot_result = bot_result.data[0]
 
-        if bot_result["user_assignment"] != None:
+        if result["status"] == "assigned_elsewhere":
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Bot is already assigned to another account: {str(bot_data.bot_id)}"
             )
 
-        user_result = db.table("users").select("*").eq("username", bot_data.user_id).execute()
-
-        if not user_result:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No User with the following ID: {str(bot_data.user_id)}"
-            )
-        
-        user = user_result.data[0]
-        current_bots = user.get("robots", [])
-        
-        if bot_data.bot_id not in current_bots:
-            current_bots.append(bot_data.bot_id)
-
-        bot_update = db.table("bots").update({"user_assignment": bot_data.user_id}).eq("mac", bot_data.bot_id).execute()
-
-        user_update = db.table("users").update({"robots": current_bots}).eq("username", bot_data.user_id).execute()
-
         return {
             "message": f"Bot {bot_data.bot_id} successfully assigned to user {bot_data.user_id}",
             "bot_id": bot_data.bot_id,
             "user_id": bot_data.user_id
         }
 
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failure to add bot: {bot_data.bot_id} to user: {bot_data.user_id}"
         )
-    
\ No newline at end of file
+
+@router.post("/add-bulk")
+async def add_bots_to_account(bulk_data: BulkBotData):
+    db = get_database()
+
+    try:
+        results = assign_bots(db, bulk_data.user_id, bulk_data.bot_ids)
+
+        return {
+            "user_id": bulk_data.user_id,
+            "assigned": sum(1 for result in results if result["status"] == "assigned"),
+            "results": results
+        }
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failure to add bots to user: {bulk_data.user_id}"
+        )
@@ -3,6 +3,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from utils.db import get_database
+from postgrest.exceptions import APIError
 import bcrypt
 import uuid
 import os
@@ -19,6 +20,14 @@ ACCESS_TOKEN_EXPIRE_DAYS = 7
 # Security scheme for protected routes
 security = HTTPBearer()
 
+# Columns needed to build a UserResponse, plus the hash when checking a password
+USER_COLUMNS = "id, username, email, robots"
+LOGIN_COLUMNS = "id, username, email, robots, password"
+
+# Postgres unique_violation, and the email constraint from models/users_constraints.sql
+UNIQUE_VIOLATION = "23505"
+EMAIL_CONSTRAINT = "users_email_key"
+
 # Pydantic models for request/response
 class UserCreate(BaseModel):
     username: str
@@ -95,7 +104,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     db = get_database()
     try:
-        user_result = db.table("users").select("*").eq("id", token_data.user_id).execute()
+        user_result = db.table("users").select(USER_COLUMNS).eq("id", token_data.user_id).execute()
         
         if not user_result.data:
             raise HTTPException(
@@ -127,6 +136,29 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def quote_filter_value(value: str) -> str:
+    """Quote a value for a PostgREST or= filter so commas and parentheses stay literal"""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+def find_login_user(db, username_or_email: str):
+    """
+    Resolve a username or email to a user row in a single query. If both a
+    username and an email match, the email wins when the value contains "@".
+    """
+    value = quote_filter_value(username_or_email)
+    result = db.table("users").select(LOGIN_COLUMNS).or_(f"username.eq.{value},email.eq.{value}").limit(2).execute()
+
+    if not result.data:
+        return None
+
+    preferred = "email" if "@" in username_or_email else "username"
+    for user in result.data:
+        if user[preferred] == username_or_email:
+            return user
+
+    return result.data[0]
+
 def check_user_exists(username: str = None, email: str = None) -> bool:
     db = get_database()
 
@@ -147,19 +179,6 @@ def check_user_exists(username: str = None, email: str = None) -> bool:
 async def create_account(user_data: UserCreate):
     db = get_database()
 
-    if check_user_exists(username=user_data.username):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already exists"
-        )
-    
-    # Check if email already exists
-    if check_user_exists(email=user_data.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already exists"
-        )
-    
     try:
         # Generate UUID for new user
         user_id = str(uuid.uuid4())
@@ -176,7 +195,18 @@ async def create_account(user_data: UserCreate):
             "robots": []  # init empty robots array
         }
         
-        result = db.table("users").insert(new_user).execute()
+        # Unique constraints on username and email reject duplicates in the same round trip
+        try:
+            result = db.table("users").insert(new_user).execute()
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+
+            # message names the violated constraint, see models/users_constraints.sql
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already exists" if EMAIL_CONSTRAINT in str(e.message) else "Username already exists"
+            )
         
         if not result.data:
             raise HTTPException(
@@ -192,6 +222,8 @@ async def create_account(user_data: UserCreate):
             robots=created_user["robots"]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -203,24 +235,14 @@ async def login(login_data: UserLogin):
     db = get_database()
     
     try:
-        user_result = None
+        user = find_login_user(db, login_data.username_or_email)
         
-        if "@" in login_data.username_or_email:
-            user_result = db.table("users").select("*").eq("email", login_data.username_or_email).execute()
-        else:
-            user_result = db.table("users").select("*").eq("username", login_data.username_or_email).execute()
-        
-        if not user_result.data and "@" not in login_data.username_or_email:
-            user_result = db.table("users").select("*").eq("email", login_data.username_or_email).execute()
-        
-        if not user_result.data:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid username/email or password"
             )
         
-        user = user_result.data[0]
-        
         if not verify_password(login_data.password, user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
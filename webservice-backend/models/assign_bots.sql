@@ -0,0 +1,52 @@
+-- Claim a list of bots for a user in one transaction.
+-- The user row is locked so concurrent claims cannot lose updates to robots,
+-- and each bot is only taken if it is unassigned or already belongs to the user.
+-- Claimed bots get their version bumped like any other state write, so ETags change.
+-- Returns one row per distinct requested MAC, in MAC order, with status assigned, assigned_elsewhere or not_found.
+create or replace function assign_bots(p_username text, p_macs text[])
+returns table (bot_mac text, result text)
+language plpgsql
+as $$
+declare
+    v_mac text;
+    v_robots text[];
+begin
+    select coalesce(users.robots, '{}') into v_robots
+    from users
+    where users.username = p_username
+    for update;
+
+    if not found then
+        raise exception 'No User with the following ID: %', p_username using errcode = 'P0002';
+    end if;
+
+    -- Visit each MAC once in sorted order so overlapping claims lock bots in
+    -- the same order and cannot deadlock each other
+    foreach v_mac in array coalesce(
+        (select array_agg(distinct m order by m) from unnest(p_macs) as m),
+        '{}'
+    ) loop
+        update bots
+        set user_assignment = p_username,
+            version = coalesce(bots.version, 0) + 1
+        where bots.mac = v_mac
+          and (bots.user_assignment is null or bots.user_assignment = p_username);
+
+        if found then
+            if not v_mac = any(v_robots) then
+                v_robots := array_append(v_robots, v_mac);
+            end if;
+            result := 'assigned';
+        elsif exists (select 1 from bots where bots.mac = v_mac) then
+            result := 'assigned_elsewhere';
+        else
+            result := 'not_found';
+        end if;
+
+        bot_mac := v_mac;
+        return next;
+    end loop;
+
+    update users set robots = v_robots where users.username = p_username;
+end;
+$$;
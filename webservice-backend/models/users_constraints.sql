@@ -0,0 +1,5 @@
+-- Unique constraints relied on by create_account, which inserts once and maps
+-- a unique_violation to "Username already exists" / "Email already exists".
+-- Their indexes also serve the username-or-email lookup done at login.
+alter table users add constraint users_username_key unique (username);
+alter table users add constraint users_email_key unique (email);
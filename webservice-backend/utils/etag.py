@@ -0,0 +1,27 @@
+import hashlib
+
+def bot_etag(version) -> str:
+    return f'"{int(version or 0)}"'
+
+def fleet_etag(rows, variant: str = "") -> str:
+    '''
+    Combine the versions of several bots into one ETag, independent of row order.
+    variant separates representations of the same bots, such as a different field selection.
+    '''
+    digest = hashlib.sha1(variant.encode("utf-8"))
+
+    for row in sorted(rows, key=lambda row: row["mac"]):
+        digest.update(f"{row['mac']}:{int(row.get('version') or 0)};".encode("utf-8"))
+
+    return f'"{digest.hexdigest()[:20]}"'
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    '''Check an If-None-Match header against an ETag, using weak comparison'''
+    if not if_none_match:
+        return False
+
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)